@@ -1,5 +1,8 @@
-import sys
 import re
+import sys
+from functools import lru_cache
+from typing import Optional, Tuple
+from weakref import WeakValueDictionary
 
 from jedi import Interpreter
 from prompt_toolkit.completion import CompleteEvent
@@ -28,8 +31,150 @@ __all__ = [
     "load_python_bindings",
     "load_sidebar_bindings",
     "load_confirm_exit_bindings",
+    "install_modal_cursor",
 ]
 
+# Insert mode in the Python input buffer. Shared by all key bindings below.
+_focused_insert = (vi_insert_mode | emacs_insert_mode) & has_focus(DEFAULT_BUFFER)
+_focused_vi_insert = vi_insert_mode & has_focus(DEFAULT_BUFFER)
+
+# Characters in front of which an opening bracket or quote is auto-closed.
+# (It is also auto-closed at the end of the line.)
+_CLOSING_CHARS = frozenset(",)}]")
+
+# A word, followed by whitespace. (Used for accepting one word of a suggestion.)
+_WORD_RE = re.compile(r"\S+\s+")
+
+# Escape sequences for the cursor shape in each Vi input mode.
+# (Block in navigation mode, underline in replace mode, beam otherwise.)
+_CURSOR_ESCAPES = {
+    InputMode.NAVIGATION: "\x1b[2 q",
+    InputMode.REPLACE: "\x1b[4 q",
+    InputMode.INSERT: "\x1b[6 q",
+}
+
+# `sidebar_visible` conditions, by `id()` of their `PythonInput`.
+_sidebar_visible_cache: "WeakValueDictionary[int, Condition]" = WeakValueDictionary()
+
+
+def _sidebar_visible(python_input):
+    """
+    Condition that is true when the sidebar of `python_input` is shown. The
+    same object is returned for every call with the same `python_input`.
+    """
+    condition = _sidebar_visible_cache.get(id(python_input))
+
+    if condition is None:
+        condition = Condition(lambda: python_input.show_sidebar)
+        _sidebar_visible_cache[id(python_input)] = condition
+
+    return condition
+
+
+# The text of the current line before and after the cursor, for the last
+# document seen by the key binding filters, as a `(document, before, after)`
+# tuple. A single key press evaluates many filters against the same
+# (immutable) `Document`, so the line is only split once. (The tuple is
+# replaced as a whole, so that concurrent readers never see a mix of two
+# documents.)
+_line_cache: Tuple[Optional[Document], str, str] = (None, "", "")
+
+
+def _current_line_around_cursor():
+    """
+    Return the (before, after) parts of the current line of the current buffer.
+    """
+    global _line_cache
+    document = get_app().current_buffer.document
+    cached_document, before, after = _line_cache
+
+    if document is not cached_document:
+        before = document.current_line_before_cursor
+        after = document.current_line_after_cursor
+        _line_cache = (document, before, after)
+
+    return before, after
+
+
+@Condition
+def _after_is_closer():
+    """
+    True when the cursor is at the end of the line, or in front of a closing
+    bracket or comma. (Opening brackets and quotes are auto-closed there.)
+    """
+    after = _current_line_around_cursor()[1]
+    return not after or after[0] in _CLOSING_CHARS
+
+
+def _prev_char_is(char):
+    """
+    Condition that is true when the character before the cursor is `char`.
+    """
+    return Condition(lambda: _current_line_around_cursor()[0].endswith(char))
+
+
+def _next_char_is(char):
+    """
+    Condition that is true when the character after the cursor is `char`.
+    """
+    return Condition(lambda: _current_line_around_cursor()[1].startswith(char))
+
+
+# Conditions that test the character right before/after the cursor, for the
+# brackets and quotes handled by the auto match bindings.
+_char_before_cursor = {c: _prev_char_is(c) for c in "([{\"'"}
+_char_after_cursor = {c: _next_char_is(c) for c in ")]}\"'"}
+_cursor_in_empty_pair = {
+    pair: _char_before_cursor[pair[0]] & _char_after_cursor[pair[1]]
+    for pair in ("()", "[]", "{}", '""', "''")
+}
+
+
+@Condition
+def _before_is_raw_prefix():
+    """
+    True when the character before the cursor is a raw string prefix.
+    """
+    return _current_line_around_cursor()[0].endswith(("r", "R"))
+
+
+def _match_raw_string_tail(s: str) -> Optional[str]:
+    """
+    If `s` ends with the start of a raw string (``r"``, ``R'``, ...) followed
+    by an optional run of dashes, return those dashes. Otherwise return `None`.
+    """
+    i = len(s)
+    while i > 0 and s[i - 1] == "-":
+        i -= 1
+
+    if i >= 2 and s[i - 1] in "\"'" and s[i - 2] in "rR":
+        return s[i:]
+    return None
+
+
+@Condition
+def _before_is_raw_string_start():
+    """
+    True when the text before the cursor opens a raw string, like ``r"`` or
+    ``R'--``.
+    """
+    return _match_raw_string_tail(_current_line_around_cursor()[0]) is not None
+
+
+def _first_word(text):
+    """
+    Return the first word of `text`, including the whitespace after it. If
+    `text` starts with whitespace, return only that whitespace.
+    (Same as the first non-empty item of ``re.split(r"(\\S+\\s+)", text)``.)
+    """
+    m = _WORD_RE.search(text)
+
+    if m is None:
+        return text
+    if m.start() > 0:
+        return text[: m.start()]
+    return m.group(0)
+
 
 @Condition
 def tab_should_insert_whitespace():
@@ -44,7 +189,99 @@ def tab_should_insert_whitespace():
     b = get_app().current_buffer
     before_cursor = b.document.current_line_before_cursor
 
-    return bool(b.text and (not before_cursor or before_cursor.isspace()))
+    # Only look at the whole text when the cursor is at the start of a line.
+    # (Whitespace before the cursor implies that the text is not empty.)
+    if not before_cursor:
+        return bool(b.text)
+    return before_cursor.isspace()
+
+
+def at_the_end(b):
+    """we consider the cursor at the end when there is no text after
+    the cursor, or only whitespace other than newlines."""
+    text = b.document.text_after_cursor
+    return "\n" not in text and (not text or text.isspace())
+
+
+def _tail_is_only_empty_lines(text, count):
+    """
+    Same as ``text.replace(" ", "").endswith("\\n" * count)``, but without
+    copying the text: scan backwards and stop at the first character that is
+    not a space or newline.
+    """
+    newlines = 0
+    i = len(text) - 1
+
+    while newlines < count and i >= 0:
+        c = text[i]
+        if c == "\n":
+            newlines += 1
+        elif c != " ":
+            return False
+        i -= 1
+
+    return newlines >= count
+
+
+@lru_cache(maxsize=8)
+def _is_multiline_python(text, cursor_position):
+    """
+    Cached `document_is_multiline_python`. The result only depends on the text
+    and the cursor position, and the same input is checked many times while
+    the user is typing.
+    """
+    return document_is_multiline_python(Document(text, cursor_position))
+
+
+@lru_cache(maxsize=1024)
+def is_callable(text=""):
+    """
+    Tell whether `text` names a class or function, according to Jedi.
+
+    Jedi only sees the builtins here (and `text` itself), so the answer for a
+    given name never changes and can be cached.
+    """
+    if not text.isidentifier():
+        return None
+
+    completions = Interpreter(text, [locals()]).complete()
+
+    # Reversed, so that the first completion wins for duplicate names.
+    by_name = {c.name: c for c in reversed(completions)}
+    match = by_name.get(text)
+    return match.type in ("class", "function") if match else None
+
+
+def _get_input_mode(self):
+    return self._input_mode
+
+
+def _set_input_mode(self, mode):
+    if hasattr(sys.stdout, "_cli"):
+        write = sys.stdout._cli.output.write_raw
+    else:
+        write = sys.stdout.write
+
+    write(_CURSOR_ESCAPES.get(mode, "\x1b[6 q"))
+    sys.stdout.flush()
+
+    self._input_mode = mode
+
+
+def install_modal_cursor(python_input):
+    """
+    Change the cursor shape according to the Vi input mode.
+
+    `ViState` is patched only once, no matter how many `PythonInput` instances
+    are created. The key timeouts of `python_input` are applied each time its
+    application starts running, and whenever the editing mode changes, rather
+    than on every read of the input mode.
+    """
+    if ViState.input_mode.fget is not _get_input_mode:
+        ViState._input_mode = InputMode.INSERT
+        ViState.input_mode = property(_get_input_mode, _set_input_mode)
+
+    python_input.app.on_reset += lambda app: python_input._apply_key_timeouts()
 
 
 def load_python_bindings(python_input):
@@ -53,7 +290,9 @@ def load_python_bindings(python_input):
     """
     bindings = KeyBindings()
 
-    sidebar_visible = Condition(lambda: python_input.show_sidebar)
+    sidebar_visible = _sidebar_visible(python_input)
+    default_buffer_focused = has_focus(python_input.default_buffer)
+    buffer_is_empty = Condition(lambda: not get_app().current_buffer.text)
     handle = bindings.add
 
     @handle("c-l")
@@ -114,15 +353,12 @@ def load_python_bindings(python_input):
 
     @Condition
     def is_multiline():
-        return document_is_multiline_python(python_input.default_buffer.document)
+        document = python_input.default_buffer.document
+        return _is_multiline_python(document.text, document.cursor_position)
 
     @handle(
         "enter",
-        filter=~sidebar_visible
-        & ~has_selection
-        & (vi_insert_mode | emacs_insert_mode)
-        & has_focus(DEFAULT_BUFFER)
-        & ~is_multiline,
+        filter=~sidebar_visible & ~has_selection & _focused_insert & ~is_multiline,
     )
     @handle(Keys.Escape, Keys.Enter, filter=~sidebar_visible & emacs_mode)
     def _(event):
@@ -134,19 +370,14 @@ def load_python_bindings(python_input):
         if b.validate():
             # When the cursor is at the end, and we have an empty line:
             # drop the empty lines, but return the value.
-            b.document = Document(
-                text=b.text.rstrip(), cursor_position=len(b.text.rstrip())
-            )
+            text = b.text.rstrip()
+            b.document = Document(text=text, cursor_position=len(text))
 
             b.validate_and_handle()
 
     @handle(
         "enter",
-        filter=~sidebar_visible
-        & ~has_selection
-        & (vi_insert_mode | emacs_insert_mode)
-        & has_focus(DEFAULT_BUFFER)
-        & is_multiline,
+        filter=~sidebar_visible & ~has_selection & _focused_insert & is_multiline,
     )
     def _(event):
         """
@@ -158,25 +389,18 @@ def load_python_bindings(python_input):
         b = event.current_buffer
         empty_lines_required = python_input.accept_input_on_enter or 10000
 
-        def at_the_end(b):
-            """we consider the cursor at the end when there is no text after
-            the cursor, or only whitespace."""
-            text = b.document.text_after_cursor
-            return text == "" or (text.isspace() and not "\n" in text)
-
         if python_input.paste_mode:
             # In paste mode, always insert text.
             b.insert_text("\n")
 
-        elif at_the_end(b) and b.document.text.replace(" ", "").endswith(
-            "\n" * (empty_lines_required - 1)
+        elif at_the_end(b) and _tail_is_only_empty_lines(
+            b.document.text, empty_lines_required - 1
         ):
             # When the cursor is at the end, and we have an empty line:
             # drop the empty lines, but return the value.
             if b.validate():
-                b.document = Document(
-                    text=b.text.rstrip(), cursor_position=len(b.text.rstrip())
-                )
+                text = b.text.rstrip()
+                b.document = Document(text=text, cursor_position=len(text))
 
                 b.validate_and_handle()
         else:
@@ -184,13 +408,7 @@ def load_python_bindings(python_input):
 
     @handle(
         "c-d",
-        filter=~sidebar_visible
-        & has_focus(python_input.default_buffer)
-        & Condition(
-            lambda:
-            # The current buffer is empty.
-            not get_app().current_buffer.text
-        ),
+        filter=~sidebar_visible & default_buffer_focused & buffer_is_empty,
     )
     def _(event):
         """
@@ -206,155 +424,98 @@ def load_python_bindings(python_input):
         else:
             event.app.exit(exception=EOFError)
 
-    @handle("c-c", filter=has_focus(python_input.default_buffer))
+    @handle("c-c", filter=default_buffer_focused)
     def _(event):
         " Abort when Control-C has been pressed. "
         event.app.exit(exception=KeyboardInterrupt, style="class:aborting")
 
-
-    def get_input_mode(self):
-        if sys.version_info[0] == 3:
-            app = get_app()
-            app.ttimeoutlen = python_input.ttimeoutlen
-            app.timeoutlen = python_input.timeoutlen
-
-        return self._input_mode
-
-
-    def set_input_mode(self, mode):
-        shape = {InputMode.NAVIGATION: 2, InputMode.REPLACE: 4}.get(mode, 6)
-        cursor = "\x1b[{} q".format(shape)
-
-        if hasattr(sys.stdout, "_cli"):
-            write = sys.stdout._cli.output.write_raw
-        else:
-            write = sys.stdout.write
-
-        write(cursor)
-        sys.stdout.flush()
-
-        self._input_mode = mode
-
-    if python_input.enable_modal_cursor:
-        ViState._input_mode = InputMode.INSERT
-        ViState.input_mode = property(get_input_mode, set_input_mode)
-
-    _preceding_text_cache = {}
-    _following_text_cache = {}
-
-    def preceding_text(pattern):
-        try:
-            return _preceding_text_cache[pattern]
-        except KeyError:
-            pass
-        m = re.compile(pattern)
-
-        def _preceding_text():
-            app = get_app()
-            return bool(m.match(app.current_buffer.document.current_line_before_cursor))
-
-        condition = Condition(_preceding_text)
-        _preceding_text_cache[pattern] = condition
-        return condition
-
-
-    def following_text(pattern):
-        try:
-            return _following_text_cache[pattern]
-        except KeyError:
-            pass
-        m = re.compile(pattern)
-
-        def _following_text():
-            app = get_app()
-            return bool(m.match(app.current_buffer.document.current_line_after_cursor))
-
-        condition = Condition(_following_text)
-        _following_text_cache[pattern] = condition
-        return condition
-
-    focused_insert = (vi_insert_mode | emacs_insert_mode) & has_focus(DEFAULT_BUFFER)
+    # Filters shared by the auto match bindings below.
+    open_before_closer = _focused_insert & _after_is_closer
+    open_raw_string_bracket = _focused_insert & _before_is_raw_string_start
+    open_raw_string_quote = _focused_insert & _before_is_raw_prefix
 
     # auto match
-    @handle('(', filter=focused_insert & following_text(r"[,)}\]]|$"))
+    @handle("(", filter=open_before_closer)
     def _(event):
-        event.current_buffer.insert_text("()")
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text("()")
+        b.cursor_left()
 
-    @handle('[', filter=focused_insert & following_text(r"[,)}\]]|$"))
+    @handle("[", filter=open_before_closer)
     def _(event):
-        event.current_buffer.insert_text("[]")
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text("[]")
+        b.cursor_left()
 
-    @handle('{', filter=focused_insert & following_text(r"[,)}\]]|$"))
+    @handle("{", filter=open_before_closer)
     def _(event):
-        event.current_buffer.insert_text("{}")
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text("{}")
+        b.cursor_left()
 
-    @handle('"', filter=focused_insert & following_text(r"[,)}\]]|$"))
+    @handle('"', filter=open_before_closer)
     def _(event):
-        event.current_buffer.insert_text('""')
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text('""')
+        b.cursor_left()
 
-    @handle("'", filter=focused_insert & following_text(r"[,)}\]]|$"))
+    @handle("'", filter=open_before_closer)
     def _(event):
-        event.current_buffer.insert_text("''")
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text("''")
+        b.cursor_left()
 
     # raw string
-    @handle('(', filter=focused_insert & preceding_text(r".*(r|R)[\"'](-*)$"))
+    @handle("(", filter=open_raw_string_bracket)
     def _(event):
-        matches = re.match(r".*(r|R)[\"'](-*)", event.current_buffer.document.current_line_before_cursor)
-        dashes = matches.group(2) or ""
-        event.current_buffer.insert_text("()" + dashes)
-        event.current_buffer.cursor_left(len(dashes) + 1)
+        b = event.current_buffer
+        dashes = _match_raw_string_tail(b.document.current_line_before_cursor) or ""
+        b.insert_text("()" + dashes)
+        b.cursor_left(len(dashes) + 1)
 
-    @handle('[', filter=focused_insert & preceding_text(r".*(r|R)[\"'](-*)$"))
+    @handle("[", filter=open_raw_string_bracket)
     def _(event):
-        matches = re.match(r".*(r|R)[\"'](-*)", event.current_buffer.document.current_line_before_cursor)
-        dashes = matches.group(2) or ""
-        event.current_buffer.insert_text("[]" + dashes)
-        event.current_buffer.cursor_left(len(dashes) + 1)
+        b = event.current_buffer
+        dashes = _match_raw_string_tail(b.document.current_line_before_cursor) or ""
+        b.insert_text("[]" + dashes)
+        b.cursor_left(len(dashes) + 1)
 
-    @handle('{', filter=focused_insert & preceding_text(r".*(r|R)[\"'](-*)$"))
+    @handle("{", filter=open_raw_string_bracket)
     def _(event):
-        matches = re.match(r".*(r|R)[\"'](-*)", event.current_buffer.document.current_line_before_cursor)
-        dashes = matches.group(2) or ""
-        event.current_buffer.insert_text("{}" + dashes)
-        event.current_buffer.cursor_left(len(dashes) + 1)
+        b = event.current_buffer
+        dashes = _match_raw_string_tail(b.document.current_line_before_cursor) or ""
+        b.insert_text("{}" + dashes)
+        b.cursor_left(len(dashes) + 1)
 
-    @handle('"', filter=focused_insert & preceding_text(r".*(r|R)$"))
+    @handle('"', filter=open_raw_string_quote)
     def _(event):
-        event.current_buffer.insert_text('""')
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text('""')
+        b.cursor_left()
 
-    @handle("'", filter=focused_insert & preceding_text(r".*(r|R)$"))
+    @handle("'", filter=open_raw_string_quote)
     def _(event):
-        event.current_buffer.insert_text("''")
-        event.current_buffer.cursor_left()
+        b = event.current_buffer
+        b.insert_text("''")
+        b.cursor_left()
 
     # just move cursor
-    @handle(')', filter=focused_insert & following_text(r"^\)"))
-    @handle(']', filter=focused_insert & following_text(r"^\]"))
-    @handle('}', filter=focused_insert & following_text(r"^\}"))
-    @handle('"', filter=focused_insert & following_text("^\""))
-    @handle("'", filter=focused_insert & following_text("^'"))
-    def _(event):
+    def move_over_closing_char(event):
         event.current_buffer.cursor_right()
 
-    @handle('backspace', filter=focused_insert & preceding_text(r".*\($") & following_text(r"^\)"))
-    @handle('backspace', filter=focused_insert & preceding_text(r".*\[$") & following_text(r"^\]"))
-    @handle('backspace', filter=focused_insert & preceding_text(r".*\{$") & following_text(r"^\}"))
-    @handle('backspace', filter=focused_insert & preceding_text('.*"$') & following_text('^"'))
-    @handle('backspace', filter=focused_insert & preceding_text(r".*'$") & following_text(r"^'"))
-    def _(event):
-        event.current_buffer.delete()
-        event.current_buffer.delete_before_cursor()
+    for char, char_after_cursor in _char_after_cursor.items():
+        handle(char, filter=_focused_insert & char_after_cursor)(move_over_closing_char)
 
-    def is_callable(text=""):
-        completions = Interpreter(text, [locals()]).complete()
-        match = next((i for i in completions if i.name == text), None)
-        return match.type in ("class", "function") if match else None
+    # delete both halves of an empty pair
+    def delete_empty_pair(event):
+        b = event.current_buffer
+        b.delete()
+        b.delete_before_cursor()
+
+    for cursor_in_empty_pair in _cursor_in_empty_pair.values():
+        handle("backspace", filter=_focused_insert & cursor_in_empty_pair)(
+            delete_empty_pair
+        )
 
     @Condition
     def auto_complete_selected_option_on_tab():
@@ -376,72 +537,76 @@ def load_python_bindings(python_input):
     def auto_complete_function_parentheses():
         return python_input.enable_auto_complete_function_parentheses
 
-    insert_mode = vi_insert_mode | emacs_insert_mode
-    focused_insert = insert_mode & has_focus(DEFAULT_BUFFER)
+    def should_insert_parentheses(b, completion):
+        """
+        After applying `completion`, should "()" be added? Only the cheap
+        setting check is done when the feature is disabled.
+        """
+        if not python_input.enable_auto_complete_function_parentheses:
+            return False
+        return bool(
+            is_callable(completion.text)
+            or is_callable(b.document.get_word_under_cursor())
+        )
+
+    def apply_completion(b, completion):
+        """
+        Apply `completion`, and add "()" after it if it's a callable.
+        """
+        b.apply_completion(completion)
+        if should_insert_parentheses(b, completion):
+            b.insert_text("()")
+            b.cursor_left()
+
     shown_not_selected = has_completions & ~completion_is_selected
 
+    # Each pair of keys below shares one filter. ("c-j" and "enter" have to
+    # be bound separately: prompt_toolkit sees Enter as c-m, not c-j.)
+    selected_on_enter = _focused_insert & completion_is_selected
+    selected_on_tab = selected_on_enter & auto_complete_selected_option_on_tab
+    top_on_enter = (
+        _focused_insert & shown_not_selected & auto_complete_top_option_on_enter
+    )
+    top_on_tab = _focused_insert & shown_not_selected & auto_complete_top_option_on_tab
+    only_on_tab = _focused_insert & ~has_completions & auto_complete_only_option_on_tab
+
     # apply selected completion option with enter
-    @handle('c-j', filter=focused_insert & completion_is_selected)
-    @handle("enter", filter=focused_insert & completion_is_selected)
+    @handle("c-j", filter=selected_on_enter)
+    @handle("enter", filter=selected_on_enter)
     def _(event):
         b = event.current_buffer
-        completion = b.complete_state.current_completion
-        b.apply_completion(completion)
-        if python_input.enable_auto_complete_function_parentheses:
-            if is_callable(completion.text) or is_callable(b.document.get_word_under_cursor()):
-                b.insert_text("()")
-                b.cursor_left()
+        apply_completion(b, b.complete_state.current_completion)
 
     # apply selected completion option with tab
-    @handle("tab", filter=focused_insert & completion_is_selected & auto_complete_selected_option_on_tab)
-    @handle("c-space", filter=focused_insert & completion_is_selected & auto_complete_selected_option_on_tab)
+    @handle("tab", filter=selected_on_tab)
+    @handle("c-space", filter=selected_on_tab)
     def _(event):
         b = event.current_buffer
-        completion = b.complete_state.current_completion
-        b.apply_completion(completion)
-        if python_input.enable_auto_complete_function_parentheses:
-            if is_callable(completion.text) or is_callable(b.document.get_word_under_cursor()):
-                b.insert_text("()")
-                b.cursor_left()
+        apply_completion(b, b.complete_state.current_completion)
 
     # apply first completion option with enter when completion menu is showing
-    @handle('c-j', filter=focused_insert & shown_not_selected & auto_complete_top_option_on_enter)
-    @handle("enter", filter=focused_insert & shown_not_selected & auto_complete_top_option_on_enter)
+    @handle("c-j", filter=top_on_enter)
+    @handle("enter", filter=top_on_enter)
     def _(event):
         b = event.current_buffer
-        completion = b.complete_state.completions[0]
-        b.apply_completion(completion)
-        if python_input.enable_auto_complete_function_parentheses:
-            if is_callable(completion.text) or is_callable(b.document.get_word_under_cursor()):
-                b.insert_text("()")
-                b.cursor_left()
+        apply_completion(b, b.complete_state.completions[0])
 
     # apply first completion option with tab if completion menu is showing
-    @handle("tab", filter=focused_insert & shown_not_selected & auto_complete_top_option_on_tab)
-    @handle("c-space", filter=focused_insert & shown_not_selected & auto_complete_top_option_on_tab)
+    @handle("tab", filter=top_on_tab)
+    @handle("c-space", filter=top_on_tab)
     def _(event):
         b = event.current_buffer
-        completion = b.complete_state.completions[0]
-        b.apply_completion(completion)
-        if python_input.enable_auto_complete_function_parentheses:
-            if is_callable(completion.text) or is_callable(b.document.get_word_under_cursor()):
-                b.insert_text("()")
-                b.cursor_left()
+        apply_completion(b, b.complete_state.completions[0])
 
     # apply completion if there is only one option, otherwise start completion
-    @handle("tab", filter=focused_insert & ~has_completions & auto_complete_only_option_on_tab)
-    @handle("c-space", filter=focused_insert & ~has_completions & auto_complete_only_option_on_tab)
+    @handle("tab", filter=only_on_tab)
+    @handle("c-space", filter=only_on_tab)
     def _(event):
         b = event.current_buffer
         complete_event = CompleteEvent(completion_requested=True)
         completions = list(b.completer.get_completions(b.document, complete_event))
         if len(completions) == 1:
-            completion = completions[0]
-            b.apply_completion(completion)
-            if python_input.enable_auto_complete_function_parentheses:
-                if is_callable(completion.text) or is_callable(b.document.get_word_under_cursor()):
-                    b.insert_text("()")
-                    b.cursor_left()
+            apply_completion(b, completions[0])
         else:
             b.start_completion(insert_common_part=True)
 
@@ -455,25 +620,23 @@ def load_sidebar_bindings(python_input):
     bindings = KeyBindings()
 
     handle = bindings.add
-    sidebar_visible = Condition(lambda: python_input.show_sidebar)
+    sidebar_visible = _sidebar_visible(python_input)
 
     @handle("up", filter=sidebar_visible)
     @handle("c-p", filter=sidebar_visible)
     @handle("k", filter=sidebar_visible)
     def _(event):
         " Go to previous option. "
-        python_input.selected_option_index = (
-            python_input.selected_option_index - 1
-        ) % python_input.option_count
+        pi = python_input
+        pi.selected_option_index = (pi.selected_option_index - 1) % pi.option_count
 
     @handle("down", filter=sidebar_visible)
     @handle("c-n", filter=sidebar_visible)
     @handle("j", filter=sidebar_visible)
     def _(event):
         " Go to next option. "
-        python_input.selected_option_index = (
-            python_input.selected_option_index + 1
-        ) % python_input.option_count
+        pi = python_input
+        pi.selected_option_index = (pi.selected_option_index + 1) % pi.option_count
 
     @handle("right", filter=sidebar_visible)
     @handle("l", filter=sidebar_visible)
@@ -492,7 +655,6 @@ def load_sidebar_bindings(python_input):
 
     @handle("c-c", filter=sidebar_visible)
     @handle("c-d", filter=sidebar_visible)
-    @handle("c-d", filter=sidebar_visible)
     @handle("enter", filter=sidebar_visible)
     @handle("escape", filter=sidebar_visible)
     def _(event):
@@ -504,10 +666,10 @@ def load_sidebar_bindings(python_input):
     def ebivim():
         return python_input.emacs_bindings_in_vi_insert_mode
 
-    focused_insert = has_focus(DEFAULT_BUFFER) & vi_insert_mode
+    emacs_in_vi_insert = _focused_vi_insert & ebivim
 
     # Needed for to accept autosuggestions in vi insert mode
-    @handle("c-e", filter=focused_insert & ebivim)
+    @handle("c-e", filter=emacs_in_vi_insert)
     def _(event):
         b = event.current_buffer
         suggestion = b.suggestion
@@ -516,7 +678,7 @@ def load_sidebar_bindings(python_input):
         else:
             nc.end_of_line(event)
 
-    @handle("c-f", filter=focused_insert & ebivim)
+    @handle("c-f", filter=emacs_in_vi_insert)
     def _(event):
         b = event.current_buffer
         suggestion = b.suggestion
@@ -525,13 +687,12 @@ def load_sidebar_bindings(python_input):
         else:
             nc.forward_char(event)
 
-    @handle("escape", "f", filter=focused_insert & ebivim)
+    @handle("escape", "f", filter=emacs_in_vi_insert)
     def _(event):
         b = event.current_buffer
         suggestion = b.suggestion
         if suggestion:
-            t = re.split(r"(\S+\s+)", suggestion.text)
-            b.insert_text(next((x for x in t if x), ""))
+            b.insert_text(_first_word(suggestion.text))
         else:
             nc.forward_word(event)
 
@@ -546,7 +707,7 @@ def load_sidebar_bindings(python_input):
     }
 
     for key, cmd in key_cmd_dict.items():
-        handle(key, filter=focused_insert & ebivim)(cmd)
+        handle(key, filter=emacs_in_vi_insert)(cmd)
 
     # Alt and Combo Control keybindings
     keys_cmd_dict = {
@@ -565,7 +726,7 @@ def load_sidebar_bindings(python_input):
     }
 
     for keys, cmd in keys_cmd_dict.items():
-        handle(*keys, filter=focused_insert & ebivim)(cmd)
+        handle(*keys, filter=emacs_in_vi_insert)(cmd)
 
     return bindings
 
@@ -612,21 +773,17 @@ def auto_newline(buffer):
     else:
         # Go to new line, but also add indentation.
         current_line = buffer.document.current_line_before_cursor.rstrip()
-        insert_text("\n")
 
         # Unident if the last line ends with 'pass', remove four spaces.
-        unindent = current_line.rstrip().endswith(" pass")
+        unindent = current_line.endswith(" pass")
 
         # Copy whitespace from current line
         current_line2 = current_line[4:] if unindent else current_line
-
-        for c in current_line2:
-            if c.isspace():
-                insert_text(c)
-            else:
-                break
+        indent = current_line2[: len(current_line2) - len(current_line2.lstrip())]
 
         # If the last line ends with a colon, add four extra spaces.
-        if current_line[-1:] == ":":
-            for x in range(4):
-                insert_text(" ")
+        if current_line.endswith(":"):
+            indent += "    "
+
+        # Insert everything at once, so that the buffer changes only once.
+        insert_text("\n" + indent)
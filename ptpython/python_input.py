@@ -54,6 +54,7 @@ from pygments.lexers import Python3Lexer as PythonLexer
 from .completer import CompletePrivateAttributes, HidePrivateCompleter, PythonCompleter
 from .history_browser import PythonHistory
 from .key_bindings import (
+    install_modal_cursor,
     load_confirm_exit_bindings,
     load_python_bindings,
     load_sidebar_bindings,
@@ -355,6 +356,12 @@ class PythonInput:
 
         self.app = self._create_application(input, output)
 
+        # The key timeouts of prompt_toolkit, restored when leaving Vi mode.
+        self._default_timeouts = (self.app.ttimeoutlen, self.app.timeoutlen)
+
+        if self.enable_modal_cursor:
+            install_modal_cursor(self)
+
         if vi_mode:
             self.app.editing_mode = EditingMode.VI
 
@@ -864,6 +871,7 @@ class PythonInput:
     @editing_mode.setter
     def editing_mode(self, value: EditingMode) -> None:
         self.app.editing_mode = value
+        self._apply_key_timeouts()
 
     @property
     def vi_mode(self) -> bool:
@@ -876,6 +884,21 @@ class PythonInput:
         else:
             self.editing_mode = EditingMode.EMACS
 
+    def _apply_key_timeouts(self) -> None:
+        """
+        Use `ttimeoutlen` and `timeoutlen` in Vi mode, and the prompt_toolkit
+        defaults otherwise. (Emacs needs the longer timeouts for the
+        Escape-Enter key sequence.) Only done with the modal cursor enabled.
+        """
+        if not self.enable_modal_cursor:
+            return
+
+        if self.vi_mode:
+            self.app.ttimeoutlen = self.ttimeoutlen
+            self.app.timeoutlen = self.timeoutlen
+        else:
+            self.app.ttimeoutlen, self.app.timeoutlen = self._default_timeouts
+
     def _on_input_timeout(self, buff: Buffer, loop=None) -> None:
         """
         When there is no input activity,